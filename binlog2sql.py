@@ -2,27 +2,100 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import time
 import datetime
 import pymysql
 from pymysqlreplication import BinLogStreamReader
-from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent
+from pymysqlreplication.event import QueryEvent, RotateEvent, FormatDescriptionEvent, XidEvent, GtidEvent, \
+    HeartbeatLogEvent
+from pymysqlreplication.gtid import Gtid
+from pymysqlreplication.row_event import WriteRowsEvent
 from binlog2sql_util import command_line_args, concat_sql_from_binlog_event, create_unique_file, temp_open, \
-    reversed_lines, is_dml_event, event_type
+    reversed_lines, is_dml_event, event_type, iter_rows, event_gtid, read_checkpoint, write_checkpoint, \
+    perf_clock, dest_table, event_table, concat_batch_sql_from_binlog_event, BATCH_INSERT_PATTERNS, \
+    mysql_error_code, DEST_TXN_ROLLBACK_ERRORS, DEST_LOST_ERRORS, parse_gtid_set
+from binlog2sql_replay import EventRecorder, ReplayStream
+from binlog2sql_shared import DestinationPool
 
 
 class Binlog2sql(object):
 
     def __init__(self, connection_settings, dest_connection_settings, start_file=None, start_pos=None, end_file=None, end_pos=None,
                  start_time=None, stop_time=None, only_schemas=None, only_tables=None, no_pk=False,
-                 flashback=False, stop_never=False, back_interval=1.0, only_dml=True, sql_type=None):
+                 flashback=False, stop_never=False, back_interval=1.0, only_dml=True, sql_type=None,
+                 capture_file=None, replay_file=None, replay_speed=1.0, max_dest_txn_rows=1000,
+                 auto_position=None, failover_settings=None, failover_retries=3, checkpoint_path=None,
+                 name=None, sql_patterns=None, dest_pool=None, metrics=None,
+                 stage_timer=None, max_events=None, max_seconds=None, batch_patterns=None, batch_rows=500,
+                 dest_retries=3, checkpoint_interval=1.0, server_id=None, slave_uuid=None):
         """
         conn_setting: {'host': 127.0.0.1, 'port': 3306, 'user': user, 'passwd': passwd, 'charset': 'utf8'}
+        capture_file: record the filtered event stream into this file
+        replay_file: replay a capture file instead of reading binlog from the source server
+        replay_speed: 1.0 original speed, N for N times faster, 0 as fast as possible
+        max_dest_txn_rows: max rows written in one destination transaction, summed over the statements to all
+                           destinations, a multi-row INSERT counts its rows. a large source transaction
+                           is applied as several destination transactions. with auto_position the rows of the open
+                           source transaction already committed are kept with the checkpoint and skipped when the
+                           transaction is sent again
+        auto_position: GTID set already applied to the destination, position the stream by GTID instead of
+                       start_file/start_pos
+        failover_settings: [conn_setting, ...] other source servers tried in order when the source is lost,
+                           only used with auto_position
+        checkpoint_path: file keeping the last source transaction applied to the destination, resume from it
+                         when it exists
+        checkpoint_interval: seconds between checkpoint writes, transactions applied after the last write
+                             are applied again when resuming
+        name: source name used in metrics
+        server_id, slave_uuid: replica server_id and uuid the stream registers with, must differ between streams
+                               reading the same source. default the source's own @@server_id and no uuid
+        sql_patterns: {table: [(dest, sql_pattern_function), ...]}, default binlog2sql_util.SQL_PATTERNS
+        dest_pool: DestinationPool shared with other sources, default a private pool of one connection
+        metrics: SyncMetrics shared with other sources
+        stage_timer: called as stage_timer(stage, table, seconds) for the read, decode and filter stages with the
+                     source table and for the transform, mogrify and apply stages with the destination table,
+                     None disables timing
+        max_events, max_seconds: stop at the first source transaction end after this many events or seconds,
+                                 with max_seconds the source sends heartbeats so that an idle source stops too
+        batch_patterns: {table: [(dest, database, table, insert_mapping), ...]}, WriteRowsEvent of these tables
+                        are applied as multi-row INSERTs of batch_rows rows. default binlog2sql_util.BATCH_INSERT_PATTERNS
+                        when sql_patterns is not set, otherwise no batching
+        dest_retries: times a destination transaction rolled back by a deadlock or lock wait timeout is run again
+                      before giving up
         """
 
-        if not start_file:
+        if capture_file and replay_file:
+            raise ValueError('Only one of capture_file or replay_file can be set')
+
+        #从checkpoint继续同步
+        self.checkpoint_path = checkpoint_path if not replay_file else None
+        checkpoint = read_checkpoint(self.checkpoint_path) if self.checkpoint_path else None
+        #GTID模式下未完成的源库事务已提交到目标库的行数
+        self.applied_gtid, self.applied_rows = (None, 0)
+        if checkpoint:
+            if auto_position is not None:
+                auto_position = checkpoint['gtid_set'] or auto_position
+                self.applied_gtid, self.applied_rows = (checkpoint.get('gtid'), checkpoint.get('gtid_rows', 0))
+            elif checkpoint['log_file']:
+                start_file, start_pos = checkpoint['log_file'], checkpoint['log_pos']
+
+        if not start_file and not replay_file and auto_position is None:
             raise ValueError('Lack of parameter: start_file')
 
         self.conn_setting = connection_settings
+        self.replica_server_id, self.slave_uuid = (server_id, slave_uuid)
+        self.source_settings = [connection_settings] + list(failover_settings or [])
+        self.source_index = 0
+        self.failover_retries = failover_retries
+        #GTID模式: 记录已应用到目标库的GTID集合
+        self.auto_position = auto_position
+        self.executed_gtid_set = parse_gtid_set(auto_position) if auto_position is not None else None
+        self.current_gtid = None
+        #源库事务BEGIN之后还未结束; 当前GTID事务已应用过，跳过
+        self.txn_open, self.skip_gtid = (False, False)
+        #当前源库事务已应用的行数; 重新发送时还需跳过的已提交行数
+        self.txn_rows, self.skip_rows = (0, 0)
+        self.source_error = None
         self.dest_conn_setting = dest_connection_settings
         self.start_file = start_file
         self.start_file = start_file
@@ -44,39 +117,175 @@ class Binlog2sql(object):
         self.no_pk, self.flashback, self.stop_never, self.back_interval = (no_pk, flashback, stop_never, back_interval)
         self.only_dml = only_dml
         self.sql_type = [t.upper() for t in sql_type] if sql_type else []
+        self.capture_file, self.replay_file, self.replay_speed = (capture_file, replay_file, replay_speed)
+        self.max_dest_txn_rows = max_dest_txn_rows
+        if not name:
+            name = replay_file if replay_file else '%s:%s' % (connection_settings['host'], connection_settings['port'])
+        self.name = name
+        self.sql_patterns, self.metrics = (sql_patterns, metrics)
+        if batch_patterns is None and sql_patterns is None:
+            batch_patterns = BATCH_INSERT_PATTERNS
+        self.batch_patterns, self.batch_rows = (batch_patterns or {}, batch_rows)
+        self.dest_pool = dest_pool if dest_pool else DestinationPool(dest_connection_settings, size=1)
+        #目标库当前事务使用的连接，已写入的行数和已执行成功的语句(事务被回滚时重新执行)
+        self.dest_connection, self.dest_cursor = (None, None)
+        self.dest_txn_rows = 0
+        self.dest_statements = []
+        self.dest_retries = dest_retries
+        self.stage_timer = stage_timer
+        self.max_events, self.max_seconds = (max_events, max_seconds)
+        self.event_count, self.start_clock = (0, None)
+        #最后一个完整应用到目标库的源库事务结束位置
+        self.checkpoint_file, self.checkpoint_pos = (None, None)
+        self.checkpoint_interval, self.checkpoint_time = (checkpoint_interval, 0)
+
+        self.binlogList = []
+        if self.replay_file:
+            #回放模式不需要源库，拼接SQL时使用目标库连接转义
+            self.connection = pymysql.connect(**self.dest_conn_setting)
+            return
+
+        self.connect_source()
+
+    def connect_source(self):
+        """connect to the first reachable source server, starting from source_index"""
+        for i in range(len(self.source_settings)):
+            index = (self.source_index + i) % len(self.source_settings)
+            try:
+                self.connection = pymysql.connect(**self.source_settings[index])
+                break
+            except pymysql.err.OperationalError as e:
+                if i == len(self.source_settings) - 1:
+                    raise
+                print(e)
+        self.source_index = index
+        self.conn_setting = self.source_settings[index]
 
         self.binlogList = []
-        self.connection = pymysql.connect(**self.conn_setting)
         with self.connection as cursor:
             #获取数据库mysql-bin和position
             cursor.execute("SHOW MASTER STATUS")
             self.eof_file, self.eof_pos = cursor.fetchone()[:2]
 
-            #获取mysql-bin.index里面的内容
-            cursor.execute("SHOW MASTER LOGS")
-            bin_index = [row[0] for row in cursor.fetchall()]
+            #GTID模式不使用binlog文件定位
+            if self.auto_position is None:
+                #获取mysql-bin.index里面的内容
+                cursor.execute("SHOW MASTER LOGS")
+                bin_index = [row[0] for row in cursor.fetchall()]
 
-            #开始文件不在index内报错
-            if self.start_file not in bin_index:
-                raise ValueError('parameter error: start_file %s not in mysql server' % self.start_file)
+                #开始文件不在index内报错
+                if self.start_file not in bin_index:
+                    raise ValueError('parameter error: start_file %s not in mysql server' % self.start_file)
 
-            #生成要解析的binlog文件：
-            binlog2i = lambda x: x.split('.')[1]
-            for binary in bin_index:
-                if binlog2i(self.start_file) <= binlog2i(binary) <= binlog2i(self.end_file):
-                    self.binlogList.append(binary)
+                #生成要解析的binlog文件：
+                binlog2i = lambda x: x.split('.')[1]
+                for binary in bin_index:
+                    if binlog2i(self.start_file) <= binlog2i(binary) <= binlog2i(self.end_file):
+                        self.binlogList.append(binary)
 
             #检查mysql是否存在server_id配置：
             cursor.execute("SELECT @@server_id")
-            self.server_id = cursor.fetchone()[0]
-            if not self.server_id:
+            source_server_id = cursor.fetchone()[0]
+            if not source_server_id:
                 raise ValueError('missing server_id in %s:%s' % (self.conn_setting['host'], self.conn_setting['port']))
-        self.dest_connection = pymysql.connect(**self.dest_conn_setting)
+            self.server_id = self.replica_server_id or source_server_id
+
+    def failover(self):
+        """switch to the next reachable source server, the stream resumes from executed_gtid_set"""
+        print('source %s:%s lost: %s' % (self.conn_setting['host'], self.conn_setting['port'], self.source_error))
+        self.current_gtid = None
+        self.txn_open, self.skip_gtid = (False, False)
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+        self.source_index = (self.source_index + 1) % len(self.source_settings)
+        for i in range(self.failover_retries):
+            try:
+                self.connect_source()
+                break
+            except pymysql.err.OperationalError as e:
+                if i == self.failover_retries - 1:
+                    raise
+                print(e)
+                time.sleep(1)
+        self.source_error = None
+
+    def fetch_events(self, stream):
+        """
+        iterate the stream, a lost source connection ends the iteration and is kept in source_error
+        the read stage includes waiting for the source, rows are decoded later in timed_rows
+        """
+        timer = self.stage_timer
+        try:
+            if timer is None:
+                for binlog_event in stream:
+                    yield binlog_event
+            else:
+                start = perf_clock()
+                for binlog_event in stream:
+                    timer('read', event_table(binlog_event), perf_clock() - start)
+                    yield binlog_event
+                    start = perf_clock()
+        except pymysql.err.OperationalError as e:
+            self.source_error = e
+
+    def timed_rows(self, binlog_event, rows):
+        """rows are decoded lazily, count their decoding in the decode stage"""
+        table = event_table(binlog_event)
+        start = perf_clock()
+        for row in rows:
+            self.stage_timer('decode', table, perf_clock() - start)
+            yield row
+            start = perf_clock()
+
+    def window_done(self):
+        """max_events or max_seconds reached"""
+        return (self.max_events and self.event_count >= self.max_events) or \
+            (self.max_seconds and perf_clock() - self.start_clock >= self.max_seconds)
 
     def process_binlog(self):
-        stream = BinLogStreamReader(connection_settings=self.conn_setting, server_id=self.server_id,
-                                    log_file=self.start_file, log_pos=self.start_pos, only_schemas=self.only_schemas,
-                                    only_tables=self.only_tables, resume_stream=True, blocking=True)
+        #录制解析后的事件，用于离线回放压测
+        self.recorder = EventRecorder(self.capture_file) if self.capture_file else None
+        self.start_clock = perf_clock()
+
+        try:
+            while True:
+                try:
+                    self.process_stream()
+                except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+                    #源库断开后，退出with时源库连接的commit也会失败
+                    if self.source_error is None:
+                        raise
+                if self.source_error is None:
+                    break
+                #GTID模式下切换源库，从已执行的GTID集合继续同步
+                if self.auto_position is None:
+                    raise self.source_error
+                self.failover()
+        finally:
+            #异常退出时也要写出最后一次flush之后录制的事件
+            if self.recorder:
+                self.recorder.close()
+        return True
+
+    def process_stream(self):
+        recorder, timer = (self.recorder, self.stage_timer)
+        #源库空闲时没有事件，需要心跳检查max_seconds
+        heartbeat = 1 if self.max_seconds else None
+        if self.replay_file:
+            stream = ReplayStream(self.replay_file, speed=self.replay_speed)
+        elif self.auto_position is not None:
+            stream = BinLogStreamReader(connection_settings=self.conn_setting, server_id=self.server_id,
+                                        auto_position=str(self.executed_gtid_set), only_schemas=self.only_schemas,
+                                        only_tables=self.only_tables, resume_stream=True, blocking=True,
+                                        slave_uuid=self.slave_uuid, slave_heartbeat=heartbeat)
+        else:
+            stream = BinLogStreamReader(connection_settings=self.conn_setting, server_id=self.server_id,
+                                        log_file=self.start_file, log_pos=self.start_pos, only_schemas=self.only_schemas,
+                                        only_tables=self.only_tables, resume_stream=True, blocking=True,
+                                        slave_uuid=self.slave_uuid, slave_heartbeat=heartbeat)
 
         #判断binglog日志是否解析完毕:
         flag_last_event = False
@@ -87,74 +296,333 @@ class Binlog2sql(object):
         #tmp_file = create_unique_file('%s.%s' % (self.conn_setting['host'], self.conn_setting['port']))
 
         #with temp_open(tmp_file, "w") as f_tmp, self.connection as cursor, self.dest_connection as dest_cursor:
-        with self.connection as cursor, self.dest_connection as dest_cursor:
-            for binlog_event in stream:
-
-                #不持续解析binlog
-                if not self.stop_never:
-                    try:
-                        event_time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
-                    except OSError:
-                        event_time = datetime.datetime(1980, 1, 1, 0, 0)
-                    if (stream.log_file == self.end_file and stream.log_pos == self.end_pos) or \
-                            (stream.log_file == self.eof_file and stream.log_pos == self.eof_pos):
-                        flag_last_event = True
-                    elif event_time < self.start_time:
-                        if not (isinstance(binlog_event, RotateEvent)
-                                or isinstance(binlog_event, FormatDescriptionEvent)):
-                            last_pos = binlog_event.packet.log_pos
+        try:
+            with self.connection as cursor:
+                for binlog_event in self.fetch_events(stream):
+                    #心跳只在源库事务之间发送
+                    if isinstance(binlog_event, HeartbeatLogEvent):
+                        if self.max_seconds and self.window_done():
+                            break
                         continue
-                    elif (stream.log_file not in self.binlogList) or \
-                            (self.end_pos and stream.log_file == self.end_file and stream.log_pos > self.end_pos) or \
-                            (stream.log_file == self.eof_file and stream.log_pos > self.eof_pos) or \
-                            (event_time >= self.stop_time):
-                        break
-                    # else:
-                    #     raise ValueError('unknown binlog file or position')
-
-                #
-                if isinstance(binlog_event, QueryEvent) and binlog_event.query == 'BEGIN':
-                    e_start_pos = last_pos
-
-                #解析DDL
-                if isinstance(binlog_event, QueryEvent) and not self.only_dml:
-                    sql = concat_sql_from_binlog_event(cursor=cursor, binlog_event=binlog_event,
-                                                       flashback=self.flashback, no_pk=self.no_pk)
-                    if sql:
-                        print(sql)
-
-                #解析DML语句
-                elif is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
-                    for row in binlog_event.rows:
-                        sql = concat_sql_from_binlog_event(cursor=cursor, binlog_event=binlog_event, no_pk=self.no_pk,
-                                                           row=row, flashback=self.flashback, e_start_pos=e_start_pos)
-                        if self.flashback:
-                            #f_tmp.write(sql + '\n')
-                            print("generate flashback sql.")
+                    self.event_count += 1
+                    if self.metrics:
+                        self.metrics.set(self.name, 'last_event_time', time.time())
+                    if timer is not None:
+                        table, start = (event_table(binlog_event), perf_clock())
+
+                    #不持续解析binlog，回放的事件在录制时已经过滤
+                    if not self.stop_never and not self.replay_file:
+                        try:
+                            event_time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
+                        except OSError:
+                            event_time = datetime.datetime(1980, 1, 1, 0, 0)
+                        if (stream.log_file == self.end_file and stream.log_pos == self.end_pos) or \
+                                (stream.log_file == self.eof_file and stream.log_pos == self.eof_pos):
+                            flag_last_event = True
+                        elif event_time < self.start_time:
+                            if not (isinstance(binlog_event, RotateEvent)
+                                    or isinstance(binlog_event, FormatDescriptionEvent)):
+                                last_pos = binlog_event.packet.log_pos
+                            if timer is not None:
+                                timer('filter', table, perf_clock() - start)
+                            continue
+                        elif (self.auto_position is None and stream.log_file not in self.binlogList) or \
+                                (self.end_pos and stream.log_file == self.end_file and stream.log_pos > self.end_pos) or \
+                                (stream.log_file == self.eof_file and stream.log_pos > self.eof_pos) or \
+                                (event_time >= self.stop_time):
+                            break
+                        # else:
+                        #     raise ValueError('unknown binlog file or position')
+                    if timer is not None:
+                        timer('filter', table, perf_clock() - start)
+
+                    if isinstance(binlog_event, GtidEvent) and self.auto_position is not None:
+                        self.start_gtid(event_gtid(binlog_event))
+
+                    #库自动重连后会从创建stream时的GTID集合重新发送，跳过已应用的事务
+                    if self.skip_gtid:
+                        if isinstance(binlog_event, XidEvent) or \
+                                (isinstance(binlog_event, QueryEvent) and binlog_event.query == 'COMMIT'):
+                            self.skip_gtid = False
+                        if flag_last_event:
+                            break
+                        continue
+
+                    #
+                    if isinstance(binlog_event, QueryEvent) and binlog_event.query == 'BEGIN':
+                        e_start_pos = last_pos
+                        self.txn_open = True
+
+                    if recorder and (isinstance(binlog_event, QueryEvent) or isinstance(binlog_event, XidEvent)):
+                        recorder.record(stream.log_file, binlog_event)
+
+                    #源库事务结束，提交目标库并记录checkpoint
+                    if isinstance(binlog_event, XidEvent) or \
+                            (isinstance(binlog_event, QueryEvent) and binlog_event.query == 'COMMIT'):
+                        self.txn_open = False
+                        self.commit_dest()
+                        self.checkpoint_file, self.checkpoint_pos = (stream.log_file, binlog_event.packet.log_pos)
+                        self.finish_gtid()
+                        self.save_checkpoint()
+                        if self.metrics:
+                            self.metrics.incr(self.name, 'transactions')
+                            self.metrics.set(self.name, 'position', '%s:%s' % (self.checkpoint_file, self.checkpoint_pos))
+                        if (self.max_events or self.max_seconds) and self.window_done():
+                            flag_last_event = True
+
+                    #解析DDL
+                    if isinstance(binlog_event, QueryEvent) and not self.only_dml:
+                        sql = concat_sql_from_binlog_event(cursor=cursor, binlog_event=binlog_event,
+                                                           flashback=self.flashback, no_pk=self.no_pk)
+                        if sql:
+                            print(sql)
+
+                    #解析DML语句
+                    elif is_dml_event(binlog_event) and event_type(binlog_event) in self.sql_type:
+                        #逐行解析，不一次性生成整个事件的所有行
+                        rows = iter_rows(binlog_event)
+                        #decode只统计行解码，不包括录制写文件
+                        if timer is not None:
+                            rows = self.timed_rows(binlog_event, rows)
+                        if self.skip_rows:
+                            rows = self.skip_applied_rows(rows)
+                        if recorder:
+                            rows = recorder.record_rows(stream.log_file, binlog_event, rows)
+                        #批量导入的INSERT按列转换，生成多行INSERT
+                        if binlog_event.table in self.batch_patterns and isinstance(binlog_event, WriteRowsEvent) \
+                                and not self.flashback:
+                            self.apply_batches(cursor, binlog_event, rows, e_start_pos)
                         else:
-                            for value in sql.values():
-                                try:
-                                    print(value)
-                                    dest_cursor.execute("%s" %value)
-                                    self.dest_connection.commit()
-                                except Exception as e:
-                                    print(e)
-
-                #binlog发生切换:
-                if not (isinstance(binlog_event, RotateEvent) or isinstance(binlog_event, FormatDescriptionEvent)):
-                    last_pos = binlog_event.packet.log_pos
-
-                #binlog解析完毕，退出，默认False不退出
-                if flag_last_event:
-                    break
+                            for row in rows:
+                                sql = concat_sql_from_binlog_event(cursor=cursor, binlog_event=binlog_event, no_pk=self.no_pk,
+                                                                   row=row, flashback=self.flashback, e_start_pos=e_start_pos,
+                                                                   sql_patterns=self.sql_patterns, stage_timer=timer)
+                                if self.flashback:
+                                    #f_tmp.write(sql + '\n')
+                                    print("generate flashback sql.")
+                                else:
+                                    for value in sql.values():
+                                        print(value)
+                                        self.execute_dest(value)
+                                    self.txn_rows += 1
+                                    if self.dest_txn_full():
+                                        self.commit_partial()
+
+                    #binlog发生切换:
+                    if not (isinstance(binlog_event, RotateEvent) or isinstance(binlog_event, FormatDescriptionEvent)):
+                        last_pos = binlog_event.packet.log_pos
 
-            stream.close()
-            
-            #f_tmp.close()
-            #if self.flashback:
-            #    self.print_rollback_sql(filename=tmp_file)
+                    #binlog解析完毕，退出，默认False不退出
+                    if flag_last_event:
+                        break
+
+                if self.source_error is None:
+                    self.commit_partial()
+                else:
+                    #丢弃未提交的部分，新源库从该事务开始重新发送，已提交的行被跳过
+                    self.rollback_dest()
+
+                #f_tmp.close()
+                #if self.flashback:
+                #    self.print_rollback_sql(filename=tmp_file)
+        finally:
+            #出错退出时也记录已提交的位置并关闭dump连接
+            self.save_checkpoint(force=True)
+            try:
+                stream.close()
+            except Exception:
+                pass
         return True
 
+    def apply_batches(self, cursor, binlog_event, rows, e_start_pos):
+        """apply rows of a WriteRowsEvent as multi-row INSERTs of batch_rows rows"""
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_rows:
+                self.apply_batch(cursor, binlog_event, batch, e_start_pos)
+                batch = []
+        if batch:
+            self.apply_batch(cursor, binlog_event, batch, e_start_pos)
+
+    def apply_batch(self, cursor, binlog_event, batch, e_start_pos):
+        sql = concat_batch_sql_from_binlog_event(cursor, binlog_event, batch, batch_patterns=self.batch_patterns,
+                                                 stage_timer=self.stage_timer)
+        for dest, value in sql.items():
+            print(value)
+            if self.execute_dest(value, rows=len(batch)):
+                continue
+            #多行INSERT整体失败，逐行重试，只跳过出错的行
+            for row in batch:
+                row_sql = concat_sql_from_binlog_event(cursor=cursor, binlog_event=binlog_event, no_pk=self.no_pk,
+                                                       row=row, flashback=self.flashback, e_start_pos=e_start_pos,
+                                                       sql_patterns=self.sql_patterns, stage_timer=self.stage_timer)
+                if dest in row_sql:
+                    print(row_sql[dest])
+                    self.execute_dest(row_sql[dest])
+        self.txn_rows += len(batch)
+        if self.dest_txn_full():
+            self.commit_partial()
+
+    def execute_dest(self, sql, rows=1):
+        """
+        execute sql in the open destination transaction, borrow a pooled connection to open one
+        rows: rows written by sql, counted against max_dest_txn_rows when sql succeeds
+        return False if sql failed, a failed statement is skipped. an error that rolls back the whole
+        transaction is retried with restart_dest, a lost connection is raised
+        """
+        if self.dest_connection is None:
+            self.dest_connection = self.dest_pool.acquire()
+            self.dest_cursor = self.dest_connection.cursor()
+        ok = True
+        if self.stage_timer is not None:
+            start = perf_clock()
+        for attempt in range(self.dest_retries + 1):
+            try:
+                self.dest_cursor.execute("%s" % sql)
+                self.dest_statements.append(sql)
+                self.dest_txn_rows += rows
+                break
+            except Exception as e:
+                code = mysql_error_code(e)
+                if code in DEST_TXN_ROLLBACK_ERRORS and attempt < self.dest_retries:
+                    self.restart_dest(e)
+                    continue
+                #事务中之前的语句已丢失，不能继续执行并在Xid时提交剩余部分
+                if code in DEST_TXN_ROLLBACK_ERRORS or code in DEST_LOST_ERRORS or \
+                        isinstance(e, pymysql.err.InterfaceError):
+                    self.abort_dest()
+                    raise
+                print(e)
+                ok = False
+                if self.metrics:
+                    self.metrics.incr(self.name, 'errors')
+                break
+        if self.stage_timer is not None:
+            self.stage_timer('apply', dest_table(sql), perf_clock() - start)
+        return ok
+
+    def restart_dest(self, error):
+        """the destination rolled back the open transaction, run its statements again in a new one"""
+        statements = self.dest_statements
+        for attempt in range(self.dest_retries):
+            print('destination transaction rolled back, retry %s: %s' % (attempt + 1, error))
+            if self.metrics:
+                self.metrics.incr(self.name, 'retries')
+            self.dest_statements = []
+            time.sleep(attempt)
+            try:
+                self.dest_connection.rollback()
+                for statement in statements:
+                    self.dest_cursor.execute(statement)
+                    self.dest_statements.append(statement)
+                return
+            except Exception as e:
+                if mysql_error_code(e) not in DEST_TXN_ROLLBACK_ERRORS:
+                    self.abort_dest()
+                    raise
+                error = e
+        self.abort_dest()
+        raise error
+
+    def commit_dest(self):
+        """commit the open destination transaction and give its connection back to the pool"""
+        self.end_dest(commit=True)
+
+    def rollback_dest(self):
+        self.end_dest(commit=False)
+
+    def end_dest(self, commit):
+        if self.dest_connection is None:
+            return
+        connection, rows = (self.dest_connection, self.dest_txn_rows)
+        self.dest_connection, self.dest_cursor, self.dest_txn_rows, self.dest_statements = (None, None, 0, [])
+        if self.stage_timer is not None:
+            start = perf_clock()
+        try:
+            if commit:
+                connection.commit()
+            else:
+                connection.rollback()
+            if self.stage_timer is not None:
+                #提交覆盖事务中的所有目标表
+                self.stage_timer('apply', '(commit)', perf_clock() - start)
+        except Exception:
+            self.dest_pool.release(connection, broken=True)
+            raise
+        self.dest_pool.release(connection)
+        if commit and self.metrics:
+            self.metrics.incr(self.name, 'rows', rows)
+
+    def abort_dest(self):
+        """drop the open destination transaction after an error that lost it, the connection is not reused"""
+        if self.dest_connection is None:
+            return
+        connection = self.dest_connection
+        self.dest_connection, self.dest_cursor, self.dest_txn_rows, self.dest_statements = (None, None, 0, [])
+        self.dest_pool.release(connection, broken=True)
+
+    def dest_txn_full(self):
+        return self.dest_txn_rows >= self.max_dest_txn_rows
+
+    def commit_partial(self):
+        """commit a part of the open source transaction, remember how many of its rows are applied"""
+        if self.dest_connection is None:
+            return
+        self.commit_dest()
+        if self.current_gtid and self.txn_open:
+            self.applied_gtid, self.applied_rows = (self.current_gtid, self.txn_rows)
+            self.save_checkpoint(force=True)
+
+    def skip_applied_rows(self, rows):
+        """skip the rows of a re-sent source transaction that are already committed to the destination"""
+        for row in rows:
+            if self.skip_rows:
+                self.skip_rows -= 1
+                self.txn_rows += 1
+                continue
+            yield row
+
+    def start_gtid(self, gtid):
+        """a GtidEvent starts the next source transaction"""
+        if self.txn_open:
+            #库自动重连后从头重新发送被中断的事务，丢弃未提交的部分
+            self.rollback_dest()
+            self.txn_open, self.current_gtid = (False, None)
+        else:
+            #DDL事务没有Xid，下一个GTID开始时上一个事务已结束
+            self.finish_gtid()
+        self.skip_gtid = Gtid(gtid) in self.executed_gtid_set
+        self.current_gtid = None if self.skip_gtid else gtid
+        #部分行已提交的事务重新发送时跳过这些行
+        self.txn_rows = 0
+        self.skip_rows = self.applied_rows if gtid == self.applied_gtid else 0
+
+    def finish_gtid(self):
+        """add the GTID of the finished source transaction to executed_gtid_set"""
+        if self.current_gtid:
+            gtid = Gtid(self.current_gtid)
+            if gtid not in self.executed_gtid_set:
+                self.executed_gtid_set = self.executed_gtid_set + gtid
+            if self.current_gtid == self.applied_gtid:
+                self.applied_gtid, self.applied_rows = (None, 0)
+            self.current_gtid = None
+
+    def save_checkpoint(self, force=False):
+        """write the checkpoint at most every checkpoint_interval seconds unless force"""
+        if self.checkpoint_path and (self.checkpoint_file is not None or self.executed_gtid_set is not None):
+            now = time.time()
+            if not force and now - self.checkpoint_time < self.checkpoint_interval:
+                return
+            self.checkpoint_time = now
+            write_checkpoint(self.checkpoint_path, {
+                'log_file': self.checkpoint_file,
+                'log_pos': self.checkpoint_pos,
+                'gtid_set': str(self.executed_gtid_set) if self.executed_gtid_set is not None else None,
+                'gtid': self.applied_gtid,
+                'gtid_rows': self.applied_rows,
+            })
+
     def print_rollback_sql(self, filename):
         """print rollback sql from tmp_file"""
         with open(filename, "rb") as f_tmp:
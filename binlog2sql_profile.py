@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+
+#源库阶段按源表统计，目标库阶段按目标表统计
+SOURCE_STAGES = ('read', 'decode', 'filter')
+DEST_STAGES = ('transform', 'mogrify', 'apply')
+STAGES = SOURCE_STAGES + DEST_STAGES
+
+
+class StageProfiler(object):
+    """
+    stage_timer for Binlog2sql, sums the time of each stage per table
+    source stages are keyed by source schema.table (event class for other events),
+    destination stages by destination `database`.`table`
+    """
+
+    def __init__(self):
+        #(表, 阶段) -> [次数, 耗时]
+        self.stats = {}
+
+    def __call__(self, stage, table, seconds):
+        entry = self.stats.get((table, stage))
+        if entry is None:
+            self.stats[(table, stage)] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+    def report(self):
+        """time of the source stages per source table and of the destination stages per destination table, in seconds"""
+        total = sum(seconds for count, seconds in self.stats.values()) or 1.0
+        lines = self.stage_report('source table', SOURCE_STAGES, total)
+        lines.append('')
+        lines.extend(self.stage_report('destination table', DEST_STAGES, total))
+        return '\n'.join(lines)
+
+    def stage_report(self, title, stages, total):
+        tables = sorted(set(table for table, stage in self.stats if stage in stages))
+        width = max([len(title)] + [len(str(table)) for table in tables])
+        lines = [('%-' + str(width) + 's') % title + ''.join('%12s' % stage for stage in stages) + '%12s%8s' % (
+            'total', '%')]
+        for table in tables:
+            times = [self.stats.get((table, stage), [0, 0.0])[1] for stage in stages]
+            lines.append(('%-' + str(width) + 's') % table + ''.join('%12.4f' % t for t in times) +
+                         '%12.4f%7.1f%%' % (sum(times), sum(times) * 100 / total))
+        times = [sum(seconds for (table, s), (count, seconds) in self.stats.items() if s == stage) for stage in stages]
+        lines.append(('%-' + str(width) + 's') % 'all' + ''.join('%12.4f' % t for t in times) +
+                     '%12.4f%7.1f%%' % (sum(times), sum(times) * 100 / total))
+        return lines
+
+
+def run_profile(binlog2sql, output='binlog2sql.prof', max_events=100000, max_seconds=None):
+    """
+    run binlog2sql for a bounded window under cProfile, dump the stats to output
+    and print the time of each stage per table
+    """
+    profiler = StageProfiler()
+    binlog2sql.stage_timer = profiler
+    binlog2sql.max_events, binlog2sql.max_seconds = (max_events, max_seconds)
+
+    prof = cProfile.Profile()
+    try:
+        prof.runcall(binlog2sql.process_binlog)
+    except KeyboardInterrupt:
+        pass
+    prof.dump_stats(output)
+    print(profiler.report())
+    print('cProfile stats written to %s' % output)
+    return profiler
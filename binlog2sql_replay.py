@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import pickle
+from pymysqlreplication.event import QueryEvent, XidEvent
+from pymysqlreplication.row_event import (
+    WriteRowsEvent,
+    UpdateRowsEvent,
+    DeleteRowsEvent,
+)
+from binlog2sql_util import event_type
+
+
+class EventRecorder(object):
+    """record decoded binlog events into a local capture file"""
+
+    def __init__(self, filename, chunk_rows=1000):
+        self.filename = filename
+        self.chunk_rows = chunk_rows
+        self.f = open(filename, 'wb')
+
+    def record(self, log_file, binlog_event, rows=None):
+        if isinstance(binlog_event, QueryEvent):
+            t = 'QUERY'
+        elif isinstance(binlog_event, XidEvent):
+            t = 'XID'
+        else:
+            t = event_type(binlog_event)
+        record = {
+            'type': t,
+            'schema': getattr(binlog_event, 'schema', None),
+            'table': getattr(binlog_event, 'table', None),
+            'primary_key': getattr(binlog_event, 'primary_key', None),
+            'query': getattr(binlog_event, 'query', None),
+            'rows': rows,
+            'timestamp': binlog_event.timestamp,
+            'log_file': log_file,
+            'log_pos': binlog_event.packet.log_pos,
+        }
+        pickle.dump(record, self.f, 2)
+        #事务结束时刷盘，进程被中断时capture文件仍然可用
+        if t == 'XID':
+            self.f.flush()
+
+    def record_rows(self, log_file, binlog_event, rows):
+        """pass rows through while recording them in chunks of chunk_rows, one record per chunk"""
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_rows:
+                self.record(log_file, binlog_event, chunk)
+                chunk = []
+            yield row
+        if chunk:
+            self.record(log_file, binlog_event, chunk)
+
+    def close(self):
+        self.f.close()
+
+
+class ReplayPacket(object):
+
+    def __init__(self, log_pos):
+        self.log_pos = log_pos
+
+
+class ReplayEvent(object):
+    """rebuild an event from a capture record, isinstance checks still match the original event class"""
+
+    def __init__(self, record):
+        self.schema = record['schema']
+        self.table = record['table']
+        self.primary_key = record['primary_key']
+        self.query = record['query']
+        self.timestamp = record['timestamp']
+        self.packet = ReplayPacket(record['log_pos'])
+        self._rows = record['rows']
+
+    @property
+    def rows(self):
+        return self._rows
+
+
+class ReplayQueryEvent(ReplayEvent, QueryEvent):
+    pass
+
+
+class ReplayXidEvent(ReplayEvent, XidEvent):
+    pass
+
+
+class ReplayWriteRowsEvent(ReplayEvent, WriteRowsEvent):
+    pass
+
+
+class ReplayUpdateRowsEvent(ReplayEvent, UpdateRowsEvent):
+    pass
+
+
+class ReplayDeleteRowsEvent(ReplayEvent, DeleteRowsEvent):
+    pass
+
+
+REPLAY_EVENTS = {
+    'QUERY': ReplayQueryEvent,
+    'XID': ReplayXidEvent,
+    'INSERT': ReplayWriteRowsEvent,
+    'UPDATE': ReplayUpdateRowsEvent,
+    'DELETE': ReplayDeleteRowsEvent,
+}
+
+
+class ReplayStream(object):
+    """
+    replay a capture file in place of BinLogStreamReader
+    speed: 1.0 original speed, N for N times faster, 0 as fast as possible
+    """
+
+    def __init__(self, filename, speed=1.0):
+        self.filename = filename
+        self.speed = speed
+        self.log_file = None
+        self.log_pos = None
+        self.first_timestamp = None
+        self.start_time = None
+        self.f = open(filename, 'rb')
+
+    def fetchone(self):
+        try:
+            record = pickle.load(self.f)
+        except EOFError:
+            return None
+
+        #按事件原始时间间隔回放
+        if self.speed:
+            if self.first_timestamp is None:
+                self.first_timestamp, self.start_time = record['timestamp'], time.time()
+            else:
+                delay = (record['timestamp'] - self.first_timestamp) / float(self.speed) - \
+                        (time.time() - self.start_time)
+                if delay > 0:
+                    time.sleep(delay)
+
+        self.log_file, self.log_pos = record['log_file'], record['log_pos']
+        return REPLAY_EVENTS[record['type']](record)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+import pymysql
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+
+class DestinationPool(object):
+    """
+    destination connections shared by several Binlog2sql instances
+    a connection is borrowed for one destination transaction and given back on commit/rollback.
+    a source holds its connection until the source transaction ends, size it to at least the number of sources
+    """
+
+    def __init__(self, conn_setting, size=4, timeout=30):
+        self.conn_setting = conn_setting
+        self.size = size
+        self.timeout = timeout
+        self.created = 0
+        self.idle = Queue()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        try:
+            return self.checked(self.idle.get_nowait())
+        except Empty:
+            pass
+
+        with self.lock:
+            create = self.created < self.size
+            if create:
+                self.created += 1
+        if create:
+            try:
+                return pymysql.connect(**self.conn_setting)
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+
+        #连接都在使用中，等待其他源归还
+        try:
+            connection = self.idle.get(timeout=self.timeout)
+        except Empty:
+            raise ValueError('no destination connection available in %s seconds' % self.timeout)
+        return self.checked(connection)
+
+    def checked(self, connection):
+        """
+        an idle connection may have passed wait_timeout, ping it before use. no transaction is open on an
+        idle connection so reconnecting loses nothing
+        """
+        try:
+            connection.ping(reconnect=True)
+        except Exception:
+            self.release(connection, broken=True)
+            return self.acquire()
+        return connection
+
+    def release(self, connection, broken=False):
+        if not broken:
+            self.idle.put(connection)
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.created -= 1
+
+
+class SyncMetrics(object):
+    """counters of every source in one process, keyed by source name"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sources = {}
+
+    def incr(self, source, key, n=1):
+        with self.lock:
+            counters = self.sources.setdefault(source, {})
+            counters[key] = counters.get(key, 0) + n
+
+    def set(self, source, key, value):
+        with self.lock:
+            self.sources.setdefault(source, {})[key] = value
+
+    def snapshot(self):
+        with self.lock:
+            return dict((source, dict(counters)) for source, counters in self.sources.items())
+
+    def report(self):
+        """one status line per source"""
+        now = time.time()
+        lines = []
+        for source, counters in sorted(self.snapshot().items()):
+            last_event_time = counters.get('last_event_time')
+            idle = '%.0fs' % (now - last_event_time) if last_event_time else '-'
+            lines.append('%s: transactions=%s rows=%s errors=%s restarts=%s position=%s idle=%s' % (
+                source, counters.get('transactions', 0), counters.get('rows', 0), counters.get('errors', 0),
+                counters.get('restarts', 0), counters.get('position', '-'), idle))
+        return '\n'.join(lines)
@@ -2,12 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
+import json
+import time
+import uuid
 import argparse
 import datetime
 import getpass
 from contextlib import contextmanager
 from pymysqlreplication.event import QueryEvent
+from pymysqlreplication.gtid import GtidSet
+from pymysqlreplication.packet import BinLogPacketWrapper
 from pymysqlreplication.row_event import (
     WriteRowsEvent,
     UpdateRowsEvent,
@@ -20,6 +26,20 @@ if sys.version > '3':
 else:
     PY3PLUS = False
 
+#性能分析计时使用的时钟
+perf_clock = getattr(time, 'perf_counter', time.time)
+
+#fix_object需要转换的类型
+if PY3PLUS:
+    FIX_TYPES = (set, bytes)
+else:
+    FIX_TYPES = (set, unicode)
+
+#目标库回滚了整个事务的错误: 死锁, 锁等待超时(innodb_rollback_on_timeout)
+DEST_TXN_ROLLBACK_ERRORS = (1213, 1205)
+#目标库连接断开，未提交的事务已丢失
+DEST_LOST_ERRORS = (2006, 2013)
+
 
 def is_valid_datetime(string):
     try:
@@ -72,6 +92,8 @@ def parse_args():
                           help="Stop binlog file to be parsed. default: '--start-file'", default='')
     interval.add_argument('--stop-position', '--end-pos', dest='end_pos', type=int,
                           help="Stop position. default: latest position of '--stop-file'", default=0)
+    interval.add_argument('--auto-position', dest='auto_position', type=str, default=None,
+                          help="Position by GTID, start after this executed GTID set instead of '--start-file'")
     interval.add_argument('--start-datetime', dest='start_time', type=str,
                           help="Start time. format %%Y-%%m-%%d %%H:%%M:%%S", default='')
     interval.add_argument('--stop-datetime', dest='stop_time', type=str,
@@ -99,6 +121,37 @@ def parse_args():
                         help='Flashback data to start_position of start_file', default=False)
     parser.add_argument('--back-interval', dest='back_interval', type=float, default=1.0,
                         help="Sleep time between chunks of 1000 rollback sql. set it to 0 if do not need sleep")
+    parser.add_argument('--checkpoint', dest='checkpoint_path', type=str, default='',
+                        help="File keeping the last applied source transaction, resume from it when it exists")
+    parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', type=float, default=1.0,
+                        help="Seconds between checkpoint writes. default: 1.0")
+    parser.add_argument('--max-dest-txn-rows', dest='max_dest_txn_rows', type=int, default=1000,
+                        help="Max rows written in one destination transaction, summed over all destinations. "
+                             "default: 1000")
+
+    add_profile_args(parser)
+
+    replay = parser.add_argument_group('capture and replay')
+    replay.add_argument('--capture-file', dest='capture_file', type=str, default='',
+                        help='Record the parsed event stream into this file')
+    replay.add_argument('--replay-file', dest='replay_file', type=str, default='',
+                        help='Replay a capture file instead of reading binlog from the server')
+    replay.add_argument('--replay-speed', dest='replay_speed', type=float, default=1.0,
+                        help='Replay speed. 1 original speed, N for N times faster, 0 as fast as possible')
+    return parser
+
+
+def add_profile_args(parser):
+    profile = parser.add_argument_group('profile')
+    profile.add_argument('--profile', dest='profile', action='store_true', default=False,
+                         help='Profile a bounded window and print the time of each source stage per source table '
+                              'and of each destination stage per destination table')
+    profile.add_argument('--profile-events', dest='profile_events', type=int, default=100000,
+                         help='Stop profiling at the first transaction end after this many events. default: 100000')
+    profile.add_argument('--profile-seconds', dest='profile_seconds', type=float, default=None,
+                         help='Stop profiling at the first transaction end after this many seconds')
+    profile.add_argument('--profile-output', dest='profile_output', type=str, default='binlog2sql.prof',
+                         help='cProfile dump file, readable by pstats, snakeviz or flameprof. default: binlog2sql.prof')
     return parser
 
 
@@ -109,8 +162,12 @@ def command_line_args(args):
     if args.help or need_print_help:
         parser.print_help()
         sys.exit(1)
-    if not args.start_file:
+    if not args.start_file and not args.replay_file and args.auto_position is None:
         raise ValueError('Lack of parameter: start_file')
+    if args.auto_position is not None:
+        parse_gtid_set(args.auto_position)
+    if args.capture_file and args.replay_file:
+        raise ValueError('Only one of capture-file or replay-file can be set')
     if args.flashback and args.stop_never:
         raise ValueError('Only one of flashback or stop-never can be True')
     if args.flashback and args.no_pk:
@@ -163,7 +220,62 @@ def event_type(event):
         t = 'DELETE'
     return t
 
-def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=None, flashback=False, no_pk=False):
+def event_table(binlog_event):
+    """schema.table of a rows event, the event class for other events"""
+    table = getattr(binlog_event, 'table', None)
+    if table:
+        return '%s.%s' % (binlog_event.schema, table)
+    return type(binlog_event).__name__
+
+def mysql_error_code(e):
+    """MySQL error number of a pymysql error, None for other exceptions"""
+    args = getattr(e, 'args', None)
+    if args and isinstance(args[0], int):
+        return args[0]
+    return None
+
+def event_gtid(binlog_event):
+    """GTID of a GtidEvent as source_id:transaction_id"""
+    return '%s:%d' % (uuid.UUID(bytes=bytes(binlog_event.sid)), binlog_event.gno)
+
+def parse_gtid_set(gtid_set):
+    """
+    GtidSet of an executed GTID set string. an empty set is rejected, mysql-replication would read it
+    as no auto_position and silently start from the end of the source binlog
+    """
+    parsed = GtidSet(gtid_set)
+    if not str(parsed):
+        raise ValueError('empty GTID set, auto_position must be the GTID set already applied to the destination, '
+                         'e.g. @@gtid_purged of the source')
+    return parsed
+
+def read_checkpoint(filename):
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+def write_checkpoint(filename, checkpoint):
+    # write to a temp file and rename, a crash never leaves a half written checkpoint
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(checkpoint, f)
+    os.rename(tmp_file, filename)
+
+def iter_rows(binlog_event):
+    """Generate rows of a rows event one at a time instead of materializing binlog_event.rows"""
+    if not isinstance(binlog_event.packet, BinLogPacketWrapper):
+        for row in binlog_event.rows:
+            yield row
+        return
+    if not binlog_event.complete:
+        return
+    while binlog_event.packet.read_bytes + 1 < binlog_event.event_size:
+        yield binlog_event._fetch_one_row()
+
+def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=None, flashback=False, no_pk=False,
+                                 sql_patterns=None, stage_timer=None):
+    """stage_timer: called as stage_timer(stage, table, seconds) for the transform and mogrify stages"""
     if flashback and no_pk:
         raise ValueError('only one of flashback or no_pk can be True')
     if not (isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, UpdateRowsEvent)
@@ -172,33 +284,21 @@ def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=Non
 
     sql = {}
     if isinstance(binlog_event, WriteRowsEvent) or isinstance(binlog_event, UpdateRowsEvent):
-        if binlog_event.table == 'users':
-            ll = users_ll_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
-            bl = users_bl_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
-            
-        elif binlog_event.table == 'user_infos':
-            ll = user_infos_ll_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
-            bl = user_infos_bl_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
-
-        elif binlog_event.table == 'user_company':
-            bl = user_company_bl_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
-            ll = None
-
-        elif binlog_event.table == 'company_subject':
-            ll = company_subject_sql_pattern(binlog_event,'api_lanlingcb_dev2',binlog_event.table, row=row, flashback=flashback, no_pk=no_pk)
-            bl = company_subject_sql_pattern(binlog_event,'blzg',binlog_event.table, row=row, flashback=flashback, no_pk=no_pk)
-
-        elif binlog_event.table == 'company_info':
-            ll = None  
-            bl = company_info_bl_sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)     
-       
-        if ll == None:
-            sql['bl'] = cursor.mogrify(bl['template'], bl['values'])
-        elif bl == None:
-            sql['ll'] = cursor.mogrify(ll['template'], ll['values'])
-        else:
-            sql['ll'] = cursor.mogrify(ll['template'], ll['values'])
-            sql['bl'] = cursor.mogrify(bl['template'], bl['values'])
+        patterns = sql_patterns if sql_patterns is not None else SQL_PATTERNS
+        for dest, sql_pattern in patterns.get(binlog_event.table, []):
+            if stage_timer is not None:
+                start = perf_clock()
+            pattern = sql_pattern(binlog_event, row=row, flashback=flashback, no_pk=no_pk)
+            if stage_timer is not None:
+                #没有生成SQL的模板不对应目标表
+                table = dest_table(pattern['template']) or '(skipped)'
+                stage_timer('transform', table, perf_clock() - start)
+                start = perf_clock()
+            #没有变化的UPDATE模板为空，不生成SQL
+            if pattern['template']:
+                sql[dest] = cursor.mogrify(pattern['template'], pattern['values'])
+                if stage_timer is not None:
+                    stage_timer('mogrify', table, perf_clock() - start)
 
         #time = datetime.datetime.fromtimestamp(binlog_event.timestamp)
         #sql += ' #start %s end %s time %s' % (e_start_pos, binlog_event.packet.log_pos, time)
@@ -210,6 +310,117 @@ def concat_sql_from_binlog_event(cursor, binlog_event, row=None, e_start_pos=Non
 
     return sql
 
+def concat_batch_sql_from_binlog_event(cursor, binlog_event, rows, batch_patterns=None, stage_timer=None):
+    """multi-row INSERT per destination for rows of a WriteRowsEvent, rows is a list of row"""
+    patterns = batch_patterns if batch_patterns is not None else BATCH_INSERT_PATTERNS
+    sql = {}
+    for dest, dest_database, dest_table_name, mapping in patterns[binlog_event.table]:
+        if stage_timer is not None:
+            table = '`%s`.`%s`' % (dest_database, dest_table_name)
+            start = perf_clock()
+        pattern = batch_insert_pattern(dest_database, dest_table_name, mapping, rows)
+        if stage_timer is not None:
+            stage_timer('transform', table, perf_clock() - start)
+            start = perf_clock()
+        sql[dest] = cursor.mogrify(pattern['template'], pattern['values'])
+        if stage_timer is not None:
+            stage_timer('mogrify', table, perf_clock() - start)
+    return sql
+
+dest_table_re = re.compile(r'\s*(?:INSERT INTO|UPDATE) (`[^`]+`\.`[^`]+`)')
+
+def dest_table(sql):
+    """`database`.`table` written by the first statement of sql, None if unknown"""
+    match = dest_table_re.match(sql)
+    return match.group(1) if match else None
+
+#UPDATE模板缓存，key: (库, 表, 条件字段, 更新字段)
+update_templates = {}
+
+def changed_update_pattern(dest_database, dest_table, key_field, key_value, mapping, row):
+    """
+    UPDATE only the mapped fields whose value changed, template is '' if nothing mapped changed
+    mapping: [(dest_field, source_field), ...]
+    """
+    fields = []
+    values = []
+    for dest_field, source_field in mapping:
+        if row['before_values'][source_field] != row['after_values'][source_field]:
+            fields.append(dest_field)
+            values.append(fix_object(row['after_values'][source_field]))
+    if not fields:
+        return {'template': '', 'values': []}
+
+    key = (dest_database, dest_table, key_field, tuple(fields))
+    template = update_templates.get(key)
+    if template is None:
+        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = %s;'.format(
+            dest_database, dest_table, ', '.join(['`%s`=%%s' % k for k in fields]), key_field
+        )
+        update_templates[key] = template
+    values.append(key_value)
+    return {'template': template, 'values': values}
+
+def fix_column(column):
+    """fix_object over a whole column, values are only touched when the column holds a type to fix"""
+    kinds = set(map(type, column))
+    if PY3PLUS and kinds == set([bytes]):
+        return [value.decode('utf-8') for value in column]
+    if any(issubclass(kind, FIX_TYPES) for kind in kinds):
+        return [fix_object(value) for value in column]
+    return column
+
+def insert_pattern(dest_database, dest_table, mapping, row):
+    """
+    INSERT of one row
+    mapping: [(dest_field, source_field, convert), ...], convert derives the value from the source value
+    """
+    template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
+        dest_database, dest_table, ','.join(m[0] for m in mapping),
+        ', '.join(['%s'] * len(mapping))
+    )
+    values = []
+    for dest_field, source_field, convert in mapping:
+        value = row['values'][source_field]
+        values.append(fix_object(convert(value) if convert else value))
+    return {'template': template, 'values': values}
+
+def batch_insert_pattern(dest_database, dest_table, mapping, rows):
+    """one multi-row INSERT of rows, same values as insert_pattern but converted column by column"""
+    template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES {3};'.format(
+        dest_database, dest_table, ','.join(m[0] for m in mapping),
+        ', '.join(['(%s)' % ', '.join(['%s'] * len(mapping))] * len(rows))
+    )
+    #按列取值，每个源字段只取一次
+    source_columns = {}
+    for dest_field, source_field, convert in mapping:
+        if source_field not in source_columns:
+            source_columns[source_field] = [row['values'][source_field] for row in rows]
+    columns = []
+    for dest_field, source_field, convert in mapping:
+        column = source_columns[source_field]
+        if convert:
+            column = [convert(value) for value in column]
+        columns.append(fix_column(column))
+    values = [value for row_values in zip(*columns) for value in row_values]
+    return {'template': template, 'values': values}
+
+def worker_account(user_id):
+    return 'wok' + str(user_id)
+
+COMPANY_SUBJECT_FIELDS = ['com_sub_id','company_name','credit_code','manage_location','legal_person','busi_license','status','reviewer_id',\
+    'reviewer_name','create_time','update_time','remark','id_card_front','id_card_back','bankcard','issuing_bank','verify_account',\
+    'payment_money','is_payment','pay_failure_reason','bnkflg','eaccty','bank_outlet']
+
+#INSERT字段映射: (目标字段, 源字段, 转换函数)
+COMPANY_SUBJECT_INSERT_FIELDS = [(k, k, None) for k in COMPANY_SUBJECT_FIELDS]
+USERS_BL_INSERT_FIELDS = [('user_id', 'id', None), ('user_name', 'phone', None), ('phonenumber', 'phone', None),
+                          ('password', 'password', None), ('status', 'valid', None), ('create_time', 'create_time', None)]
+USERS_LL_INSERT_FIELDS = [('worker_id', 'id', None), ('financial_account_id', 'id', worker_account),
+                          ('worker_password', 'password', None), ('worker_phone', 'phone', None),
+                          ('valid', 'valid', None), ('create_time', 'create_time', None),
+                          ('is_del', 'is_delete', None), ('salt', 'salt', None)]
+
 def company_info_bl_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False):
     template = ''
     values = []
@@ -228,23 +439,19 @@ def company_info_bl_sql_pattern(binlog_event, row=None, flashback=False, no_pk=F
         values = map(fix_object, values)
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};UPDATE `{5}`.`{6}` SET {7} = "{8}" WHERE {9} = {10};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['com_sub_id'],
-            dest_database,'company_subject','company_logo',row['after_values']['logo'],'com_sub_id',row['after_values']['com_sub_id']
-        )
-        for i in dest_fields[1:]:
-            values.append(row['after_values'][i])
-        values = map(fix_object, values)
+        info = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['com_sub_id'],
+                                      [(k, k) for k in dest_fields[1:]], row)
+        logo = changed_update_pattern(dest_database, 'company_subject', 'com_sub_id', row['after_values']['com_sub_id'],
+                                      [('company_logo', 'logo')], row)
+        template = info['template'] + logo['template']
+        values = info['values'] + logo['values']
 
     return {'template': template, 'values': list(values)}
 
 def company_subject_sql_pattern(binlog_event,dest_database,dest_table, row=None, flashback=False, no_pk=False):
     template = ''
     values = []
-    dest_fields = ['com_sub_id','company_name','credit_code','manage_location','legal_person','busi_license','status','reviewer_id',\
-        'reviewer_name','create_time','update_time','remark','id_card_front','id_card_back','bankcard','issuing_bank','verify_account',\
-        'payment_money','is_payment','pay_failure_reason','bnkflg','eaccty','bank_outlet']
+    dest_fields = COMPANY_SUBJECT_FIELDS
 
     if isinstance(binlog_event, WriteRowsEvent):
         template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
@@ -256,13 +463,9 @@ def company_subject_sql_pattern(binlog_event,dest_database,dest_table, row=None,
         values = map(fix_object, values)
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['com_sub_id']
-        )
-        for i in dest_fields[1:]:
-            values.append(row['after_values'][i])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['com_sub_id'],
+                                         [(k, k) for k in dest_fields[1:]], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -271,9 +474,7 @@ def company_subject_bl_sql_pattern(binlog_event, row=None, flashback=False, no_p
     values = []
     dest_database = 'blzg'
     dest_table = 'company_subject'
-    dest_fields = ['com_sub_id','company_name','credit_code','manage_location','legal_person','busi_license','status','reviewer_id',\
-        'reviewer_name','create_time','update_time','remark','id_card_front','id_card_back','bankcard','issuing_bank','verify_account',\
-        'payment_money','is_payment','pay_failure_reason','bnkflg','eaccty','bank_outlet']
+    dest_fields = COMPANY_SUBJECT_FIELDS
 
     if isinstance(binlog_event, WriteRowsEvent):
         template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
@@ -285,13 +486,9 @@ def company_subject_bl_sql_pattern(binlog_event, row=None, flashback=False, no_p
         values = map(fix_object, values)
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['com_sub_id']
-        )
-        for i in dest_fields[1:]:
-            values.append(row['after_values'][i])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['com_sub_id'],
+                                         [(k, k) for k in dest_fields[1:]], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -300,9 +497,7 @@ def company_subject_ll_sql_pattern(binlog_event, row=None, flashback=False, no_p
     values = []
     dest_database = 'api_lanlingcb_dev2'
     dest_table = 'company_subject'
-    dest_fields = ['com_sub_id','company_name','credit_code','manage_location','legal_person','busi_license','status','reviewer_id',\
-        'reviewer_name','create_time','update_time','remark','id_card_front','id_card_back','bankcard','issuing_bank','verify_account',\
-            'payment_money','is_payment','pay_failure_reason','bnkflg','eaccty','bank_outlet']
+    dest_fields = COMPANY_SUBJECT_FIELDS
 
     if isinstance(binlog_event, WriteRowsEvent):
         template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
@@ -314,13 +509,9 @@ def company_subject_ll_sql_pattern(binlog_event, row=None, flashback=False, no_p
         values = map(fix_object, values)
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['com_sub_id']
-        )
-        for i in dest_fields[1:]:
-            values.append(row['after_values'][i])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['com_sub_id'],
+                                         [(k, k) for k in dest_fields[1:]], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -340,12 +531,9 @@ def user_company_bl_sql_pattern(binlog_event, row=None, flashback=False, no_pk=F
         values = map(fix_object, values)
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['user_id']
-        )
-        values.append(row['after_values']['com_sub_id'])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['user_id'],
+                                         [('com_sub_id', 'com_sub_id')], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -357,31 +545,14 @@ def users_bl_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False):
     dest_fields = ['user_id','user_name','phonenumber','password','status','create_time']
 
     if isinstance(binlog_event, WriteRowsEvent):
-        template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-            dest_database, dest_table,','.join(dest_fields),
-            ', '.join(['%s'] * len(dest_fields))
-        )
-        values.append(row['values']['id'])
-        values.append(row['values']['phone'])
-        values.append(row['values']['phone'])
-        values.append(row['values']['password'])
-        values.append(row['values']['valid'])
-        values.append(row['values']['create_time'])
-
-        values = map(fix_object, values)
+        pattern = insert_pattern(dest_database, dest_table, USERS_BL_INSERT_FIELDS, row)
+        template, values = pattern['template'], pattern['values']
 
     elif isinstance(binlog_event, UpdateRowsEvent) and row['before_values']['id'] >100:
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['id']
-        )
-        values.append(row['after_values']['phone'])
-        values.append(row['after_values']['phone'])
-        values.append(row['after_values']['password'])
-        values.append(row['after_values']['valid'])
-        values.append(row['after_values']['create_time'])
-
-        values = map(fix_object,values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['id'],
+                                         [('user_name', 'phone'), ('phonenumber', 'phone'), ('password', 'password'),
+                                          ('status', 'valid'), ('create_time', 'create_time')], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -393,33 +564,14 @@ def users_ll_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False):
     dest_fields = ['worker_id','financial_account_id','worker_password','worker_phone','valid','create_time','is_del','salt']
 
     if isinstance(binlog_event, WriteRowsEvent):
-        template = 'INSERT INTO `{0}`.`{1}`({2}) VALUES ({3});'.format(
-            dest_database, dest_table,','.join(dest_fields),
-            ', '.join(['%s'] * len(dest_fields))
-        )
-
-        values.append(row['values']['id']) 
-        values.append('wok'+str(row['values']['id']))
-        values.append(row['values']['password'])
-        values.append(row['values']['phone'])
-        values.append(row['values']['valid'])
-        values.append(row['values']['create_time'])
-        values.append(row['values']['is_delete'])
-        values.append(row['values']['salt'])
-        values = map(fix_object, values)
+        pattern = insert_pattern(dest_database, dest_table, USERS_LL_INSERT_FIELDS, row)
+        template, values = pattern['template'], pattern['values']
 
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[2:]]),dest_fields[0],row['before_values']['id']
-        )
-        values.append(row['after_values']['password'])
-        values.append(row['after_values']['phone'])
-        values.append(row['after_values']['valid'])
-        values.append(row['after_values']['create_time'])
-        values.append(row['after_values']['is_delete'])
-        values.append(row['after_values']['salt'])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['id'],
+                                         [('worker_password', 'password'), ('worker_phone', 'phone'), ('valid', 'valid'),
+                                          ('create_time', 'create_time'), ('is_del', 'is_delete'), ('salt', 'salt')], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -443,15 +595,10 @@ def user_infos_bl_sql_pattern(binlog_event, row=None, flashback=False, no_pk=Fal
         values = map(fix_object, values)
     
     elif isinstance(binlog_event, UpdateRowsEvent) and row['before_values']['user_id'] >100:
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['user_id']
-        )
-        values.append(row['after_values']['nickname'])
-        values.append(row['after_values']['email'])
-        values.append(row['after_values']['sex'])
-        values.append(row['after_values']['photo'])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['user_id'],
+                                         [('nick_name', 'nickname'), ('email', 'email'), ('sex', 'sex'),
+                                          ('avatar', 'photo')], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
@@ -479,23 +626,32 @@ def user_infos_ll_sql_pattern(binlog_event, row=None, flashback=False, no_pk=Fal
         values = map(fix_object, values)
     
     elif isinstance(binlog_event, UpdateRowsEvent):
-        template = 'UPDATE `{0}`.`{1}` SET {2} WHERE {3} = {4};'.format(
-            dest_database, dest_table,
-            ', '.join(['`%s`=%%s' % k for k in dest_fields[1:]]),dest_fields[0],row['before_values']['user_id']
-        )
-        values.append(row['after_values']['sn'])
-        values.append(row['after_values']['real_name'])
-        values.append(row['after_values']['nickname'])
-        values.append(row['after_values']['sex'])
-        values.append(row['after_values']['email'])
-        values.append(row['after_values']['certified'])
-        values.append(row['after_values']['photo'])
-        values.append(row['after_values']['per_sign'])
-        values.append(row['after_values']['score'])
-        values = map(fix_object, values)
+        pattern = changed_update_pattern(dest_database, dest_table, dest_fields[0], row['before_values']['user_id'],
+                                         [('sn', 'sn'), ('worker_name', 'real_name'), ('nickname', 'nickname'),
+                                          ('sex', 'sex'), ('worker_email', 'email'), ('certified', 'certified'),
+                                          ('photo_url', 'photo'), ('information', 'per_sign'), ('score', 'score')], row)
+        template, values = pattern['template'], pattern['values']
 
     return {'template': template, 'values': list(values)}
 
+#源表 -> [(目标库标识, 生成SQL的函数), ...]
+SQL_PATTERNS = {
+    'users': [('ll', users_ll_sql_pattern), ('bl', users_bl_sql_pattern)],
+    'user_infos': [('ll', user_infos_ll_sql_pattern), ('bl', user_infos_bl_sql_pattern)],
+    'user_company': [('bl', user_company_bl_sql_pattern)],
+    'company_subject': [('ll', company_subject_ll_sql_pattern), ('bl', company_subject_bl_sql_pattern)],
+    'company_info': [('bl', company_info_bl_sql_pattern)],
+}
+
+#源表 -> [(目标库标识, 库, 表, INSERT字段映射), ...]
+#只包含INSERT是单条普通INSERT的表，WriteRowsEvent可以批量生成多行INSERT，结果与SQL_PATTERNS逐行生成的一致
+BATCH_INSERT_PATTERNS = {
+    'users': [('ll', 'api_lanlingcb_dev2', 'worker', USERS_LL_INSERT_FIELDS),
+              ('bl', 'blzg', 'sys_user', USERS_BL_INSERT_FIELDS)],
+    'company_subject': [('ll', 'api_lanlingcb_dev2', 'company_subject', COMPANY_SUBJECT_INSERT_FIELDS),
+                        ('bl', 'blzg', 'company_subject', COMPANY_SUBJECT_INSERT_FIELDS)],
+}
+
 def generate_sql_pattern(binlog_event, row=None, flashback=False, no_pk=False):
     template = ''
     values = []
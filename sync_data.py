@@ -2,9 +2,15 @@
 # -*- coding: utf-8 -*-
 
 from binlog2sql import Binlog2sql
-import linecache,datetime
+from binlog2sql_util import add_profile_args
+from binlog2sql_profile import run_profile
+import sys,argparse,linecache,datetime
 
 def main():
+    #--profile: 分析一段时间内各阶段耗时
+    parser = add_profile_args(argparse.ArgumentParser(description='Sync binlog data to the destination'))
+    args = parser.parse_args(sys.argv[1:])
+
     conn_setting = {
     "host": "192.168.1.231",
     "port": 3306,
@@ -21,6 +27,10 @@ def main():
     'charset': 'utf8'
     }
 
+    #源库故障切换候选，需要GTID定位(auto_position)
+    failover_settings = [
+    ]
+
     #mydql_data_dir = "/var/lib/mysql/"
     #start_file = linecache.getlines(mydql_data_dir+"mysql-bin.index")[-1].split('/')[-1].strip()
     start_file = 'mysql-bin.000020'
@@ -29,6 +39,12 @@ def main():
     sql_type = ['INSERT', 'UPDATE']
     only_dml = True
     start_pos = 4
+    #GTID定位: 已同步的GTID集合，None时使用start_file/start_pos
+    auto_position = None
+    #记录已同步位置，存在时从该位置继续
+    checkpoint_path = ''
+    #checkpoint写入间隔(秒)，恢复时重新应用最后一次写入之后的事务
+    checkpoint_interval = 1.0
     end_file = ''
     end_pos = 0
 
@@ -40,11 +56,27 @@ def main():
     flashback = False
     no_pk = False
     back_interval = 1.0
+    #目标库单个事务最多写入的行数(所有目标库合计)
+    max_dest_txn_rows = 1000
+
+    #录制事件流: capture_file; 离线回放: replay_file, replay_speed为0时尽快回放
+    capture_file = ''
+    replay_file = ''
+    replay_speed = 1.0
     binlog2sql = Binlog2sql(connection_settings=conn_setting, dest_connection_settings=dest_conn_setting, start_file=start_file, start_pos=start_pos,
                             end_file=end_file, end_pos=end_pos, start_time=start_time,
                             stop_time=stop_time, only_schemas=databases, only_tables=tables,
                             no_pk=no_pk, flashback=flashback, stop_never=stop_never,
-                            back_interval=back_interval, only_dml=only_dml, sql_type=sql_type)
-    binlog2sql.process_binlog()
+                            back_interval=back_interval, only_dml=only_dml, sql_type=sql_type,
+                            capture_file=capture_file, replay_file=replay_file, replay_speed=replay_speed,
+                            max_dest_txn_rows=max_dest_txn_rows, auto_position=auto_position,
+                            failover_settings=failover_settings, checkpoint_path=checkpoint_path,
+                            checkpoint_interval=checkpoint_interval)
+
+    if args.profile:
+        run_profile(binlog2sql, output=args.profile_output, max_events=args.profile_events,
+                    max_seconds=args.profile_seconds)
+    else:
+        binlog2sql.process_binlog()
 if __name__ == "__main__":
     main()
\ No newline at end of file
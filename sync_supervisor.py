@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Run several sources in one process, each source in its own thread.
+The destination connection pool and metrics are shared by all sources.
+
+python sync_supervisor.py sync_sources.json
+
+{
+    "destination": {"host": "127.0.0.1", "port": 3306, "user": "root", "passwd": "", "charset": "utf8"},
+    "pool_size": 4,
+    "pool_timeout": 30,
+    "server_id_base": 4000,
+    "status_interval": 60,
+    "restart_interval": 10,
+    "sources": [
+        {
+            "name": "user_service",
+            "server_id": 4001,
+            "patterns": "binlog2sql_util.SQL_PATTERNS",
+            "batch_patterns": "binlog2sql_util.BATCH_INSERT_PATTERNS",
+            "connection_settings": {"host": "127.0.0.1", "port": 3306, "user": "root", "passwd": "", "charset": "utf8"},
+            "auto_position": "3e11fa47-71ca-11e1-9e33-c80aa9429562:1-100",
+            "checkpoint_path": "user_service.checkpoint",
+            "only_schemas": ["user_service"],
+            "only_tables": ["users", "user_infos"],
+            "sql_type": ["INSERT", "UPDATE"]
+        }
+    ]
+}
+
+Other keys of a source are passed to Binlog2sql as they are. A failed source is restarted after
+restart_interval seconds, set checkpoint_path so that it resumes where it stopped.
+
+Each source registers with its source server as a replica. server_id must be unique among the
+replicas of that server, or the sources disconnect each other. A source without server_id uses
+server_id_base plus its index. The pool holds at least one connection per source.
+'''
+
+import sys
+import json
+import uuid
+import time
+import threading
+import importlib
+import traceback
+from binlog2sql import Binlog2sql
+from binlog2sql_shared import DestinationPool, SyncMetrics
+
+
+def load_patterns(path):
+    """load sql patterns from 'module.attribute'"""
+    module, attribute = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module), attribute)
+
+
+class SourceWorker(threading.Thread):
+    """sync one source, restart it from its checkpoint when it fails"""
+
+    def __init__(self, options, dest_conn_setting, dest_pool, metrics, restart_interval=10):
+        options = dict(options)
+        self.source_name = options.pop('name')
+        patterns = options.pop('patterns', None)
+        batch_patterns = options.pop('batch_patterns', None)
+        options.setdefault('stop_never', True)
+        options.setdefault('sql_type', ['INSERT', 'UPDATE'])
+        #同一个源名重启后使用相同的uuid，替换源库上旧的dump线程
+        options.setdefault('slave_uuid', str(uuid.uuid5(uuid.NAMESPACE_URL, 'binlog2sql/' + self.source_name)))
+        options['sql_patterns'] = load_patterns(patterns) if patterns else None
+        options['batch_patterns'] = load_patterns(batch_patterns) if batch_patterns else None
+        super(SourceWorker, self).__init__(name=self.source_name)
+        self.daemon = True
+        self.options = options
+        self.dest_conn_setting = dest_conn_setting
+        self.dest_pool, self.metrics = (dest_pool, metrics)
+        self.restart_interval = restart_interval
+
+    def run(self):
+        while True:
+            binlog2sql = None
+            try:
+                binlog2sql = Binlog2sql(dest_connection_settings=self.dest_conn_setting, name=self.source_name,
+                                        dest_pool=self.dest_pool, metrics=self.metrics, **self.options)
+                binlog2sql.process_binlog()
+                if not self.options['stop_never']:
+                    return
+            except Exception:
+                traceback.print_exc()
+            #归还未完成事务占用的目标库连接
+            if binlog2sql:
+                try:
+                    binlog2sql.rollback_dest()
+                except Exception:
+                    pass
+            self.metrics.incr(self.source_name, 'restarts')
+            time.sleep(self.restart_interval)
+
+
+def main(args):
+    if not args:
+        print('usage: sync_supervisor.py CONFIG_FILE')
+        sys.exit(1)
+    with open(args[0]) as f:
+        config = json.load(f)
+
+    sources = [dict(source) for source in config['sources']]
+    server_id_base = config.get('server_id_base', 4000)
+    for index, source in enumerate(sources):
+        source.setdefault('server_id', server_id_base + index + 1)
+    server_ids = [source['server_id'] for source in sources]
+    if len(set(server_ids)) != len(server_ids):
+        raise ValueError('server_id of sources must be unique: %s' % server_ids)
+
+    #每个源在事务结束前一直占用一个连接，连接数不少于源的数量
+    dest_pool = DestinationPool(config['destination'], size=max(config.get('pool_size', 4), len(sources)),
+                                timeout=config.get('pool_timeout', 30))
+    metrics = SyncMetrics()
+    workers = [SourceWorker(source, config['destination'], dest_pool, metrics,
+                            restart_interval=config.get('restart_interval', 10))
+               for source in sources]
+    for worker in workers:
+        worker.start()
+
+    status_interval = config.get('status_interval', 60)
+    while any(worker.is_alive() for worker in workers):
+        time.sleep(status_interval)
+        print(metrics.report())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
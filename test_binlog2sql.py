@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import uuid
+import json
+import shutil
+import tempfile
+import unittest
+import pymysql
+from pymysqlreplication.event import GtidEvent
+import binlog2sql
+from binlog2sql import Binlog2sql
+from binlog2sql_replay import REPLAY_EVENTS, ReplayPacket
+from test_binlog2sql_util import MogrifyCursor, users_values
+
+SID = uuid.UUID('3e11fa47-71ca-11e1-9e33-c80aa9429562')
+
+
+class FakeCursor(MogrifyCursor):
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.result = None
+
+    def execute(self, sql):
+        if sql == 'SHOW MASTER STATUS':
+            self.result = ('mysql-bin.000003', 4)
+        elif sql == 'SELECT @@server_id':
+            self.result = (1,)
+        else:
+            self.connection.pending.append(sql)
+
+    def fetchone(self):
+        return self.result
+
+
+class FakeConnection(object):
+    """source or destination connection, statements are kept until commit like a transaction"""
+    committed = []
+
+    def __init__(self, **settings):
+        self.pending = []
+
+    def __enter__(self):
+        return FakeCursor(self)
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        FakeConnection.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def ping(self, reconnect=True):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeStream(object):
+    """BinLogStreamReader sending a fixed list of events, an exception in the list is raised"""
+
+    def __init__(self, events):
+        self.events = events
+        self.log_file, self.log_pos = ('mysql-bin.000003', 4)
+
+    def __iter__(self):
+        for event in self.events:
+            if isinstance(event, BaseException):
+                raise event
+            self.log_pos = event.packet.log_pos
+            yield event
+
+    def close(self):
+        pass
+
+
+class FakeGtidEvent(GtidEvent):
+
+    def __init__(self, gno):
+        self.sid, self.gno, self.timestamp = (SID.bytes, gno, 0)
+        self.packet = ReplayPacket(4)
+
+
+def source_event(event_type, table=None, rows=None, query=None, log_pos=4):
+    return REPLAY_EVENTS[event_type]({'type': event_type, 'schema': 'user_service', 'table': table,
+                                      'primary_key': 'id', 'query': query, 'rows': rows, 'timestamp': 0,
+                                      'log_pos': log_pos})
+
+
+def insert_users(*user_ids):
+    return source_event('INSERT', 'users', [{'values': users_values(user_id)} for user_id in user_ids])
+
+
+def transaction(gno, *row_events, **kwargs):
+    """GTID, BEGIN, row events and Xid, without Xid when committed=False"""
+    events = [FakeGtidEvent(gno), source_event('QUERY', query='BEGIN')] + list(row_events)
+    if kwargs.get('committed', True):
+        events.append(source_event('XID', log_pos=gno * 100))
+    return events
+
+
+class GtidResendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.streams = []
+        FakeConnection.committed = []
+        self.real_connect, pymysql.connect = (pymysql.connect, FakeConnection)
+        self.real_reader = binlog2sql.BinLogStreamReader
+        binlog2sql.BinLogStreamReader = lambda **kwargs: FakeStream(self.streams.pop(0))
+
+    def tearDown(self):
+        pymysql.connect = self.real_connect
+        binlog2sql.BinLogStreamReader = self.real_reader
+        shutil.rmtree(self.tmp_dir)
+
+    def sync(self, events, **kwargs):
+        self.streams.append(events)
+        kwargs.setdefault('auto_position', '%s:1-4' % SID)
+        kwargs.setdefault('batch_patterns', {})
+        b = Binlog2sql({'host': 'source', 'port': 3306}, {'host': 'destination'}, sql_type=['INSERT'],
+                       stop_never=True, **kwargs)
+        b.process_binlog()
+        return b
+
+    def committed_ids(self):
+        """worker_id of every committed row, in commit order"""
+        return [int(worker_id) for sql in FakeConnection.committed if '`worker`' in sql
+                for worker_id in re.findall(r"\((\d+), 'wok", sql)]
+
+    def test_skip_resent_transactions(self):
+        #库重连后从创建stream时的GTID集合重新发送
+        b = self.sync(transaction(5, insert_users(105)) + transaction(6, insert_users(106)) +
+                      transaction(5, insert_users(105)) + transaction(6, insert_users(106)) +
+                      transaction(7, insert_users(107)))
+        self.assertEqual(self.committed_ids(), [105, 106, 107])
+        self.assertEqual(str(b.executed_gtid_set), '%s:1-7' % SID)
+
+    def test_finish_resent_gtid_without_overlap(self):
+        b = self.sync(transaction(5, insert_users(105)))
+        b.current_gtid = '%s:5' % SID
+        b.finish_gtid()
+        self.assertEqual(str(b.executed_gtid_set), '%s:1-5' % SID)
+
+    def test_roll_back_interrupted_transaction(self):
+        b = self.sync(transaction(5, insert_users(105), committed=False) + transaction(5, insert_users(105)))
+        self.assertEqual(self.committed_ids(), [105])
+        self.assertEqual(str(b.executed_gtid_set), '%s:1-5' % SID)
+
+    def test_skip_rows_committed_before_resend(self):
+        for batch_patterns in (None, {}):
+            FakeConnection.committed = []
+            #每行写入两个目标库，前两行达到4行上限后提交
+            b = self.sync(transaction(5, insert_users(101, 102), insert_users(103), committed=False) +
+                          transaction(5, insert_users(101, 102), insert_users(103)),
+                          max_dest_txn_rows=4, batch_patterns=batch_patterns)
+            self.assertEqual(self.committed_ids(), [101, 102, 103])
+            self.assertEqual((b.applied_gtid, b.applied_rows), (None, 0))
+
+    def test_ddl_transaction_without_xid(self):
+        ddl = [FakeGtidEvent(5), source_event('QUERY', query='ALTER TABLE users ADD COLUMN age INT')]
+        b = self.sync(ddl + transaction(6, insert_users(106)) + ddl + transaction(6, insert_users(106)) +
+                      transaction(7, insert_users(107)))
+        self.assertEqual(self.committed_ids(), [106, 107])
+        self.assertEqual(str(b.executed_gtid_set), '%s:1-7' % SID)
+
+    def test_resume_partial_transaction_from_checkpoint(self):
+        checkpoint = os.path.join(self.tmp_dir, 'checkpoint')
+        events = transaction(5, insert_users(105)) + \
+            transaction(6, insert_users(101, 102), insert_users(103), committed=False) + [KeyboardInterrupt()]
+        with self.assertRaises(KeyboardInterrupt):
+            self.sync(events, checkpoint_path=checkpoint, max_dest_txn_rows=4)
+        with open(checkpoint) as f:
+            saved = json.load(f)
+        self.assertEqual((saved['gtid_set'], saved['gtid'], saved['gtid_rows']),
+                         ('%s:1-5' % SID, '%s:6' % SID, 2))
+
+        b = self.sync(transaction(5, insert_users(105)) + transaction(6, insert_users(101, 102), insert_users(103)),
+                      checkpoint_path=checkpoint, max_dest_txn_rows=4)
+        self.assertEqual(self.committed_ids(), [105, 101, 102, 103])
+        self.assertEqual(str(b.executed_gtid_set), '%s:1-6' % SID)
+
+
+if __name__ == '__main__':
+    unittest.main()
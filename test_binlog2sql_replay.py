@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+import binlog2sql_replay
+from binlog2sql_replay import EventRecorder, ReplayStream, REPLAY_EVENTS
+from pymysqlreplication.event import QueryEvent, XidEvent
+from pymysqlreplication.row_event import WriteRowsEvent
+
+
+def make_event(event_type, table=None, rows=None, query=None, timestamp=1000, log_pos=4):
+    return REPLAY_EVENTS[event_type]({'type': event_type, 'schema': 'user_service', 'table': table,
+                                      'primary_key': 'id', 'query': query, 'rows': rows, 'timestamp': timestamp,
+                                      'log_pos': log_pos})
+
+
+class FakeClock(object):
+    """time module for ReplayStream, sleep advances the clock"""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class CaptureReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, 'capture.bin')
+        self.clock = FakeClock()
+        self.real_time, binlog2sql_replay.time = (binlog2sql_replay.time, self.clock)
+
+    def tearDown(self):
+        binlog2sql_replay.time = self.real_time
+        shutil.rmtree(self.tmp_dir)
+
+    def capture(self, rows):
+        recorder = EventRecorder(self.filename, chunk_rows=3)
+        recorder.record('mysql-bin.000020', make_event('QUERY', query='BEGIN', timestamp=1000, log_pos=100))
+        insert = make_event('INSERT', table='users', timestamp=1002, log_pos=300)
+        #record_rows逐行透传
+        self.assertEqual(list(recorder.record_rows('mysql-bin.000020', insert, iter(rows))), rows)
+        recorder.record('mysql-bin.000020', make_event('XID', timestamp=1006, log_pos=400))
+        recorder.close()
+
+    def test_round_trip(self):
+        rows = [{'values': {'id': i, 'phone': b'1380000%04d' % i, 'tags': set(['a']), 'note': None,
+                            'create_time': datetime.datetime(2020, 1, 1, 0, 0, i)}} for i in range(7)]
+        self.capture(rows)
+
+        stream = ReplayStream(self.filename, speed=0)
+        events = list(stream)
+        stream.close()
+
+        #7行按chunk_rows=3分成3条记录
+        self.assertEqual([type(e) for e in events], [REPLAY_EVENTS['QUERY']] + [REPLAY_EVENTS['INSERT']] * 3 +
+                         [REPLAY_EVENTS['XID']])
+        self.assertIsInstance(events[0], QueryEvent)
+        self.assertIsInstance(events[1], WriteRowsEvent)
+        self.assertIsInstance(events[-1], XidEvent)
+        self.assertEqual(events[0].query, 'BEGIN')
+        self.assertEqual([e.packet.log_pos for e in events], [100, 300, 300, 300, 400])
+        self.assertEqual((stream.log_file, stream.log_pos), ('mysql-bin.000020', 400))
+        self.assertEqual([len(e.rows) for e in events[1:4]], [3, 3, 1])
+        self.assertEqual([row for e in events[1:4] for row in e.rows], rows)
+        self.assertEqual(events[1].table, 'users')
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_speed_scales_timestamp_deltas(self):
+        self.capture([{'values': {'id': 1}}])
+
+        stream = ReplayStream(self.filename, speed=2.0)
+        list(stream)
+        stream.close()
+
+        #相对第一个事件2秒和6秒，2倍速回放时在1秒和3秒发出
+        self.assertEqual(self.clock.sleeps, [1.0, 2.0])
+        self.assertEqual(self.clock.now, 103.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+import pymysql
+from binlog2sql_shared import DestinationPool
+
+
+class PingConnection(object):
+
+    def __init__(self, **settings):
+        self.alive = True
+        self.pings = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise pymysql.err.OperationalError(2003, "Can't connect to MySQL server")
+
+    def close(self):
+        pass
+
+
+class DestinationPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.real_connect, pymysql.connect = (pymysql.connect, PingConnection)
+        self.pool = DestinationPool({}, size=1, timeout=0.1)
+
+    def tearDown(self):
+        pymysql.connect = self.real_connect
+
+    def test_ping_idle_connection(self):
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(), connection)
+        self.assertEqual(connection.pings, 1)
+
+    def test_replace_connection_failing_ping(self):
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        connection.alive = False
+        replacement = self.pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertEqual(self.pool.created, 1)
+
+    def test_timeout_when_all_in_use(self):
+        self.pool.acquire()
+        self.assertRaises(ValueError, self.pool.acquire)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import datetime
+import unittest
+from pymysql.converters import escape_item
+from binlog2sql_replay import REPLAY_EVENTS
+import binlog2sql_util
+from binlog2sql_util import concat_sql_from_binlog_event, changed_update_pattern, \
+    concat_batch_sql_from_binlog_event, BATCH_INSERT_PATTERNS, COMPANY_SUBJECT_FIELDS
+
+
+class MogrifyCursor(object):
+    """cursor.mogrify without a server connection"""
+
+    def mogrify(self, query, args=None):
+        if args is None:
+            return query
+        return query % tuple(escape_item(arg, 'utf8') for arg in args)
+
+
+def make_event(event_type, table, rows, schema='user_service'):
+    return REPLAY_EVENTS[event_type]({'type': event_type, 'schema': schema, 'table': table, 'primary_key': 'id',
+                                      'query': None, 'rows': rows, 'timestamp': 0, 'log_pos': 4})
+
+
+def users_values(user_id, **changes):
+    values = {'id': user_id, 'phone': b'13800000000', 'password': 'pw', 'valid': 1,
+              'create_time': datetime.datetime(2020, 1, 1), 'is_delete': 0, 'salt': 's', 'last_login': 1}
+    values.update(changes)
+    return values
+
+
+def company_subject_values(com_sub_id, **changes):
+    values = dict((field, '%s %s' % (field, com_sub_id)) for field in COMPANY_SUBJECT_FIELDS)
+    values.update({'com_sub_id': com_sub_id, 'create_time': datetime.datetime(2020, 1, 1), 'payment_money': 1.5})
+    values.update(changes)
+    return values
+
+
+#每列覆盖全部是bytes, bytes和None混合, set, None
+BATCH_ROWS = {
+    'users': [users_values(101), users_values(102, phone=b'13900000000', salt=None),
+              users_values(103, password=set(['a', 'b']), salt=b'\xe7\x9b\x90'), users_values(104, valid=None)],
+    'company_subject': [company_subject_values(1, bankcard=b'6222', status=set(['ok'])),
+                        company_subject_values(2, bankcard=None, remark=b'\xe5\xa4\x87\xe6\xb3\xa8'),
+                        company_subject_values(3, bankcard=b'6223', remark=None, status=set())],
+}
+
+
+def company_info_values(**changes):
+    values = {'com_sub_id': 7, 'scale': 's', 'nature': 'n', 'main_business': 'm', 'introduction': 'i', 'label': 'l',
+              'website': 'w', 'lng': 1.5, 'lat': 2.5, 'banner': 'b', 'area_code': 'a', 'area_name': 'an',
+              'address': 'ad', 'logo': 'logo.png'}
+    values.update(changes)
+    return values
+
+
+class ChangedUpdatePatternTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = MogrifyCursor()
+
+    def update_sql(self, table, before, after):
+        row = {'before_values': before, 'after_values': after}
+        return concat_sql_from_binlog_event(self.cursor, make_event('UPDATE', table, [row]), row=row)
+
+    def test_no_op_update_generates_nothing(self):
+        #只有未映射的字段变化
+        self.assertEqual(self.update_sql('users', users_values(101), users_values(101, last_login=2)), {})
+
+    def test_set_only_changed_columns(self):
+        sql = self.update_sql('users', users_values(101), users_values(101, password='new', valid=0))
+        self.assertEqual(sql['ll'], "UPDATE `api_lanlingcb_dev2`.`worker` SET `worker_password`='new', `valid`=0 "
+                                    "WHERE worker_id = 101;")
+        self.assertEqual(sql['bl'], "UPDATE `blzg`.`sys_user` SET `password`='new', `status`=0 WHERE user_id = 101;")
+
+    def test_template_cached_by_changed_columns(self):
+        row = {'before_values': {'id': 1, 'a': 1, 'b': 1}, 'after_values': {'id': 1, 'a': 2, 'b': 1}}
+        first = changed_update_pattern('db', 't', 'id', 1, [('a', 'a'), ('b', 'b')], row)
+        key = ('db', 't', 'id', ('a',))
+        self.assertIs(binlog2sql_util.update_templates[key], first['template'])
+        self.assertEqual(first['values'], [2, 1])
+
+        row = {'before_values': {'id': 2, 'a': 1, 'b': 1}, 'after_values': {'id': 2, 'a': 3, 'b': 1}}
+        second = changed_update_pattern('db', 't', 'id', 2, [('a', 'a'), ('b', 'b')], row)
+        self.assertIs(second['template'], first['template'])
+        self.assertEqual(second['values'], [3, 2])
+
+        row = {'before_values': {'id': 2, 'a': 1, 'b': 1}, 'after_values': {'id': 2, 'a': 1, 'b': 4}}
+        self.assertEqual(changed_update_pattern('db', 't', 'id', 2, [('a', 'a'), ('b', 'b')], row)['template'],
+                         'UPDATE `db`.`t` SET `b`=%s WHERE id = %s;')
+
+    def test_company_info_logo_only(self):
+        sql = self.update_sql('company_info', company_info_values(), company_info_values(logo='new.png'))
+        self.assertEqual(sql, {'bl': "UPDATE `blzg`.`company_subject` SET `company_logo`='new.png' "
+                                     "WHERE com_sub_id = 7;"})
+
+    def test_company_info_fields_and_logo(self):
+        sql = self.update_sql('company_info', company_info_values(), company_info_values(scale='l', logo='new.png'))
+        self.assertEqual(sql, {'bl': "UPDATE `blzg`.`company_info` SET `scale`='l' WHERE com_sub_id = 7;"
+                                     "UPDATE `blzg`.`company_subject` SET `company_logo`='new.png' "
+                                     "WHERE com_sub_id = 7;"})
+
+
+class BatchInsertTest(unittest.TestCase):
+
+    def test_batch_insert_matches_per_row(self):
+        cursor = MogrifyCursor()
+        self.assertEqual(sorted(BATCH_ROWS), sorted(BATCH_INSERT_PATTERNS))
+        for table, values in BATCH_ROWS.items():
+            rows = [{'values': row_values} for row_values in values]
+            event = make_event('INSERT', table, rows)
+            per_row = {}
+            for row in rows:
+                for dest, sql in concat_sql_from_binlog_event(cursor, event, row=row).items():
+                    per_row.setdefault(dest, []).append(sql)
+            batch = concat_batch_sql_from_binlog_event(cursor, event, rows)
+
+            self.assertEqual(sorted(batch), sorted(per_row), table)
+            for dest, sqls in per_row.items():
+                #逐行INSERT的VALUES依次拼接后与多行INSERT一致
+                head = sqls[0].split(' VALUES ', 1)[0]
+                tuples = [sql.split(' VALUES ', 1)[1][:-1] for sql in sqls]
+                self.assertEqual(batch[dest], '%s VALUES %s;' % (head, ', '.join(tuples)), (table, dest))
+
+
+if __name__ == '__main__':
+    unittest.main()